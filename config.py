@@ -2,12 +2,37 @@
 Configuration for Relay Guard Bot - Community Moderator
 """
 import os
+import re
+import secrets
 
 # Bot settings
 BOT_TOKEN = os.environ.get("RELAY_GUARD_BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
 
-# Admin IDs (can override bot decisions)
-ADMIN_IDS = [6394311885]  # Your Telegram ID
+# Public HTTPS base URL for webhook mode (empty = long polling)
+PUBLIC_URL = os.environ.get("PUBLIC_URL", "")
+
+# Secret Telegram sends with every webhook update (A-Z, a-z, 0-9, _ and -);
+# a random one is used per run if unset, since the webhook is re-registered
+# on every start
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+
+# Log level (DEBUG also logs every analyzed message)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+
+# Admin IDs (can override bot decisions), comma-separated Telegram IDs
+ADMIN_IDS = frozenset(
+    int(x) for x in os.environ.get("RELAY_ADMIN_IDS", "6394311885").split(",") if x.strip()
+)
+
+# Chat that receives report notifications: a numeric chat ID or @channelname
+# (empty = DM every admin). A malformed ID fails here, at startup
+_admin_chat = os.environ.get("RELAY_ADMIN_CHAT_ID", "").strip()
+if not _admin_chat:
+    ADMIN_CHAT_ID = None
+elif _admin_chat.startswith("@"):
+    ADMIN_CHAT_ID = _admin_chat
+else:
+    ADMIN_CHAT_ID = int(_admin_chat)
 
 # TEST MODE - only warn, never ban/mute
 TEST_MODE = False
@@ -42,6 +67,21 @@ SPAM_PATTERNS = [
     r"@\w+bot\b",  # Bot mentions
 ]
 
+# SPAM_PATTERNS compiled once at import, as a single alternation
+# (group p<i> names the SPAM_PATTERNS entry that matched).
+# re.ASCII keeps case-insensitive matching on the ASCII path, but it also
+# narrows \w, \b, \d and \s to ASCII, so it is only added when no pattern
+# uses them (@\w+bot\b must still match a Cyrillic bot name)
+_UNICODE_CLASS_RE = re.compile(r"\\[wWbBdDsS]")
+SPAM_PATTERNS_RE = re.compile(
+    "|".join(f"(?P<p{i}>{p})" for i, p in enumerate(SPAM_PATTERNS)),
+    re.IGNORECASE | (
+        re.ASCII
+        if all(p.isascii() and not _UNICODE_CLASS_RE.search(p) for p in SPAM_PATTERNS)
+        else 0
+    )
+)
+
 # Captcha settings
 CAPTCHA_TIMEOUT_SECONDS = 120  # 2 minutes to solve
 CAPTCHA_KICK_ON_FAIL = True  # Kick if not solved
@@ -53,7 +93,8 @@ REP_POINTS_MANUAL = 2  # Points for manual +rep
 # Paths
 from pathlib import Path
 DATA_DIR = Path(__file__).parent / "data"
-VIOLATIONS_FILE = DATA_DIR / "violations.json"
+VIOLATIONS_LOG = DATA_DIR / "violations.jsonl"  # Append-only, one violation per line
+VIOLATIONS_FILE = DATA_DIR / "violations.json"  # Legacy format, imported once into the log
 REPORTS_FILE = DATA_DIR / "reports.json"
 CAPTCHA_FILE = DATA_DIR / "pending_captcha.json"
 REP_COOLDOWN_FILE = DATA_DIR / "rep_cooldowns.json"
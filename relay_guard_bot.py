@@ -22,90 +22,238 @@ Setup:
 """
 
 import asyncio
+import functools
+import hmac
+import json
+import logging
+import logging.handlers
 import os
-import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from datetime import datetime, timedelta
+import queue
+import re
+import signal
+import time
+from dataclasses import dataclass
+from typing import Optional
+from datetime import datetime, timedelta, timezone
 from telegram import Update, ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, MessageHandler,
     ContextTypes, filters, CallbackQueryHandler
 )
 from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
+
+try:
+    import uvloop
+except ImportError:  # optional, the stdlib event loop works too
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
+
+# === KEEP-ALIVE & WEBHOOK SERVER ===
+HEALTH_RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 18\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+    b"Relay Guard Bot OK"
+)
+
+
+def _empty_response(status: str) -> bytes:
+    return f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode()
 
 
-# === KEEP-ALIVE SERVER ===
-class HealthHandler(BaseHTTPRequestHandler):
-    """Simple health check endpoint for Render"""
-    def do_GET(self):
-        self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
-        self.end_headers()
-        self.wfile.write(b'Relay Guard Bot OK')
+WEBHOOK_OK = _empty_response("200 OK")
+WEBHOOK_BAD_REQUEST = _empty_response("400 Bad Request")
+WEBHOOK_FORBIDDEN = _empty_response("403 Forbidden")
+MAX_UPDATE_BYTES = 1 << 20  # Far above any real update
+
+
+async def _receive_update(app: Application, head: bytes, reader: asyncio.StreamReader) -> bytes:
+    """Queue an update POSTed by Telegram and return the HTTP response"""
+    headers = {}
+    for line in head.decode("latin-1").split("\r\n")[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    
+    # Only Telegram knows the secret registered with the webhook
+    secret = headers.get("x-telegram-bot-api-secret-token", "").encode("latin-1")
+    if not hmac.compare_digest(secret, WEBHOOK_SECRET.encode()):
+        return WEBHOOK_FORBIDDEN
+    
+    length = headers.get("content-length", "")
+    if not length.isdigit() or not 0 < int(length) <= MAX_UPDATE_BYTES:
+        return WEBHOOK_BAD_REQUEST
+    body = await reader.readexactly(int(length))
     
-    def log_message(self, format, *args):
-        pass  # Suppress logs
+    try:
+        update = Update.de_json(json.loads(body), app.bot)
+    except Exception as e:
+        logger.warning("Dropped a malformed webhook update: %s", e)
+        return WEBHOOK_BAD_REQUEST
+    await app.update_queue.put(update)
+    return WEBHOOK_OK
 
 
-def start_health_server():
-    """Start health check server in background thread"""
+async def _handle_http(
+    app: Application,
+    webhook_path: Optional[bytes],
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter
+):
+    """
+    Telegram's POSTs to webhook_path are queued as updates; any other
+    request is Render's health check and gets 200 OK
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+        method, path, _ = head.split(b" ", 2)
+        if method == b"POST" and path == webhook_path:
+            response = await _receive_update(app, head, reader)
+        else:
+            response = HEALTH_RESPONSE
+        writer.write(response)
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_health_server(app: Application) -> asyncio.AbstractServer:
+    """
+    Start the health check server on the bot's event loop. In webhook mode
+    it is also the webhook endpoint, so Render's health check keeps working
+    on the one port the service exposes
+    """
     port = int(os.environ.get('PORT', 8080))
-    server = HTTPServer(('0.0.0.0', port), HealthHandler)
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
-    print(f"   Health server: http://0.0.0.0:{port}")
+    webhook_path = f"/{BOT_TOKEN}".encode() if PUBLIC_URL else None
+    server = await asyncio.start_server(
+        functools.partial(_handle_http, app, webhook_path), '0.0.0.0', port
+    )
+    logger.info("Health server: http://0.0.0.0:%s", port)
+    return server
 
 from config import (
-    BOT_TOKEN, ADMIN_IDS, MUTE_DURATION_MINUTES, BAN_DURATION_DAYS,
-    CAPTCHA_TIMEOUT_SECONDS, CAPTCHA_KICK_ON_FAIL,
-    REP_COOLDOWN_SECONDS, REP_POINTS_MANUAL, DATA_DIR
+    BOT_TOKEN, PUBLIC_URL, LOG_LEVEL, ADMIN_IDS, MUTE_DURATION_MINUTES, BAN_DURATION_DAYS,
+    WEBHOOK_SECRET, ADMIN_CHAT_ID, ALLOWED_GROUP_ID, CAPTCHA_TIMEOUT_SECONDS, CAPTCHA_KICK_ON_FAIL,
+    REP_COOLDOWN_SECONDS, REP_POINTS_MANUAL
 )
 try:
     from config import TEST_MODE
 except ImportError:
     TEST_MODE = False
 
-import json
 import random
 from rules import RULES_COMBINED, VIOLATION_TYPES
-from analyzer import MessageAnalyzer, AnalysisResult
+from analyzer import MessageAnalyzer, AnalysisResult, KeywordSet
 from violations import (
     Violation, Report, record_violation, get_user_violations,
     should_escalate, record_report, get_pending_reports,
-    update_report_status, get_stats
+    update_report_status, get_stats,
+    flush as flush_violations, flush_async as flush_violations_async
 )
 from reputation import (
     rep_defend, rep_positive, rep_violation, rep_helpful,
-    get_rep, get_leaderboard, add_rep, REP_HELPFUL_ANSWER
+    get_rep, get_leaderboard, add_rep, REP_HELPFUL_ANSWER,
+    flush as flush_reputation, flush_async as flush_reputation_async
 )
 
 
 # Initialize analyzer
 analyzer = MessageAnalyzer()
 
-# Store for report context (message being reported)
-pending_report_context: dict[int, dict] = {}
+# Words that earn +rep when said about Relay
+_PRAISE_WORDS = KeywordSet((
+    "love", "best", "great", "awesome", "amazing", "perfect", "excellent",
+    "люблю", "лучший", "круто", "супер", "отлично"
+))
+
+class TTLDict:
+    """
+    Insertion-ordered mapping whose entries expire after ttl seconds
+    (and, with maxsize, are evicted oldest first beyond that many).
+    Every entry shares the same ttl, so the oldest entry always expires
+    first and eviction just pops from the front on writes; reads are a
+    plain dict probe with no bookkeeping.
+    """
+    
+    def __init__(self, ttl: float, maxsize: Optional[int] = None) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: dict = {}  # key -> (expires_at, value)
+    
+    def __setitem__(self, key, value) -> None:
+        now = time.monotonic()
+        self._data.pop(key, None)  # Re-insert at the young end
+        self._data[key] = (now + self.ttl, value)
+        self._evict(now)
+    
+    def __contains__(self, key) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+    
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+    
+    def items(self) -> list:
+        """Snapshot of the live (key, value) pairs, oldest first"""
+        now = time.monotonic()
+        return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at > now]
+    
+    def _evict(self, now: float) -> None:
+        data = self._data
+        while data:
+            oldest = next(iter(data))
+            if (self.maxsize is None or len(data) <= self.maxsize) and data[oldest][0] > now:
+                break
+            del data[oldest]
+
 
-# Store for pending captchas {user_id: {"correct": int, "chat_id": int, "message_id": int, "timestamp": str}}
-pending_captcha: dict[int, dict] = {}
+@dataclass(slots=True)
+class PendingCaptcha:
+    """Captcha shown to a new member and not solved yet"""
+    correct: int
+    chat_id: int
+    message_id: int
+    username: str
+    deadline: float  # time.monotonic() after which the member is kicked
 
-# Store for rep cooldowns {giver_id: {receiver_id: timestamp}}
-rep_cooldowns: dict[int, dict] = {}
 
+# Store for pending captchas {user_id: PendingCaptcha}
+# No size cap: every entry must survive until _expire_captchas kicks the
+# member (a raid must not push restricted members out unkicked); the sweeper
+# drops entries after CAPTCHA_TIMEOUT_SECONDS, the ttl is only a backstop
+pending_captcha = TTLDict(ttl=3600)
 
-def _load_json(filepath) -> dict:
-    """Load JSON file or return empty dict"""
-    if filepath.exists():
-        with open(filepath, "r") as f:
-            return json.load(f)
-    return {}
+# Store for rep cooldowns {(giver_id, receiver_id): time.monotonic() of last +rep}
+# Entries expire with the cooldown itself
+rep_cooldowns = TTLDict(ttl=REP_COOLDOWN_SECONDS, maxsize=50_000)
 
 
-def _save_json(filepath, data: dict):
-    """Save dict to JSON file"""
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
-    with open(filepath, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def display_name(user) -> str:
+    """Telegram username, or the numeric ID for users without one"""
+    return user.username or str(user.id)
+
+
+def friendly_name(user) -> str:
+    """Like display_name, but prefers the first name over the numeric ID"""
+    return user.username or user.first_name or str(user.id)
 
 
 # === RESPONSE MESSAGES ===
@@ -136,6 +284,13 @@ MESSAGES = {
     "rules": RULES_COMBINED
 }
 
+# Templates used on the moderation path, looked up once
+_format_warn = MESSAGES["warn"].format
+_format_mute = MESSAGES["mute"].format
+_format_ban = MESSAGES["ban"].format
+_format_report_received = MESSAGES["report_received"].format
+_format_report_actioned = MESSAGES["report_actioned"].format
+
 
 # === MODERATION ACTIONS ===
 async def warn_user(
@@ -148,7 +303,7 @@ async def warn_user(
     """Send a warning to user"""
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
-        text=MESSAGES["warn"].format(username=username, reason=reason),
+        text=_format_warn(username=username, reason=reason),
         parse_mode=ParseMode.MARKDOWN
     )
 
@@ -159,22 +314,24 @@ async def mute_user(
     user_id: int,
     username: str,
     reason: str,
-    duration_minutes: int = MUTE_DURATION_MINUTES
+    duration_minutes: int = MUTE_DURATION_MINUTES,
+    now: Optional[datetime] = None
 ):
-    """Mute a user temporarily"""
-    until_date = datetime.now() + timedelta(minutes=duration_minutes)
+    """Mute a user temporarily (now: current UTC time, if already known)"""
+    chat_id = update.effective_chat.id
+    until_date = (now or datetime.now(timezone.utc)) + timedelta(minutes=duration_minutes)
     
     try:
         await context.bot.restrict_chat_member(
-            chat_id=update.effective_chat.id,
+            chat_id=chat_id,
             user_id=user_id,
             permissions=ChatPermissions(can_send_messages=False),
             until_date=until_date
         )
         
         await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=MESSAGES["mute"].format(
+            chat_id=chat_id,
+            text=_format_mute(
                 username=username,
                 reason=reason,
                 duration=duration_minutes
@@ -182,7 +339,7 @@ async def mute_user(
             parse_mode=ParseMode.MARKDOWN
         )
     except Exception as e:
-        print(f"Failed to mute user {user_id}: {e}")
+        logger.warning("Failed to mute user %s: %s", user_id, e)
 
 
 async def ban_user(
@@ -190,30 +347,31 @@ async def ban_user(
     context: ContextTypes.DEFAULT_TYPE,
     user_id: int,
     username: str,
-    reason: str
+    reason: str,
+    now: Optional[datetime] = None
 ):
-    """Ban a user from the group"""
+    """Ban a user from the group (now: current UTC time, if already known)"""
+    chat_id = update.effective_chat.id
+    
+    # No until_date means a permanent ban
+    until_date = None
+    if BAN_DURATION_DAYS > 0:
+        until_date = (now or datetime.now(timezone.utc)) + timedelta(days=BAN_DURATION_DAYS)
+    
     try:
-        if BAN_DURATION_DAYS > 0:
-            until_date = datetime.now() + timedelta(days=BAN_DURATION_DAYS)
-            await context.bot.ban_chat_member(
-                chat_id=update.effective_chat.id,
-                user_id=user_id,
-                until_date=until_date
-            )
-        else:
-            await context.bot.ban_chat_member(
-                chat_id=update.effective_chat.id,
-                user_id=user_id
-            )
+        await context.bot.ban_chat_member(
+            chat_id=chat_id,
+            user_id=user_id,
+            until_date=until_date
+        )
         
         await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=MESSAGES["ban"].format(username=username, reason=reason),
+            chat_id=chat_id,
+            text=_format_ban(username=username, reason=reason),
             parse_mode=ParseMode.MARKDOWN
         )
     except Exception as e:
-        print(f"Failed to ban user {user_id}: {e}")
+        logger.warning("Failed to ban user %s: %s", user_id, e)
 
 
 async def delete_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -221,7 +379,14 @@ async def delete_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         await update.message.delete()
     except Exception as e:
-        print(f"Failed to delete message: {e}")
+        logger.warning("Failed to delete message: %s", e)
+
+
+async def save_violation(violation: Violation):
+    """Record a violation; bans are persisted right away, off the event loop"""
+    record_violation(violation, flush_bans=False)
+    if violation.action_taken == "ban":
+        await flush_violations_async()
 
 
 async def take_action(
@@ -255,23 +420,31 @@ async def take_action(
     # Check if should escalate based on history
     should_esc, recommended = should_escalate(user_id)
     
+    now = datetime.now(timezone.utc)
     action_taken = "none"
+    ops = []
     
     # Delete message if needed
     if result.should_delete:
-        await delete_message(update, context)
+        ops.append(delete_message(update, context))
     
     # Determine action (escalate if needed)
     if result.should_ban or (should_esc and recommended == "ban"):
-        await ban_user(update, context, user_id, username, result.reason)
+        ops.append(ban_user(update, context, user_id, username, result.reason, now=now))
         action_taken = "ban"
     elif result.should_mute or (should_esc and recommended == "mute"):
-        await mute_user(update, context, user_id, username, result.reason)
+        ops.append(mute_user(update, context, user_id, username, result.reason, now=now))
         action_taken = "mute"
     elif result.should_warn:
-        await warn_user(update, context, user_id, username, result.reason)
+        ops.append(warn_user(update, context, user_id, username, result.reason))
         action_taken = "warn"
     
+    # Deleting and acting are independent API calls, run them together; a
+    # failed call must not stop the violation from being recorded
+    for outcome in await asyncio.gather(*ops, return_exceptions=True):
+        if isinstance(outcome, Exception):
+            logger.warning("Moderation call for user %s failed: %s", user_id, outcome)
+    
     # Record violation
     if action_taken != "none":
         violation = Violation(
@@ -279,80 +452,115 @@ async def take_action(
             username=username,
             violation_type=result.violation_type or "unknown",
             reason=result.reason,
-            message_text=message_text[:500],  # Truncate
+            message_text=message_text,  # Truncated by Violation
             action_taken=action_taken,
-            timestamp=datetime.now().isoformat(),
+            timestamp=now.isoformat(),
             confidence=result.confidence
         )
-        record_violation(violation)
+        await save_violation(violation)
+
+
+# === PER-CHAT ACTION QUEUES ===
+# Moderation actions run on one worker per chat: actions within a chat keep
+# their order, but a slow API call in one chat never holds up another chat
+# or the update loop. Workers exit once their queue is empty.
+chat_queues: dict[int, asyncio.Queue] = {}
+_chat_workers: set[asyncio.Task] = set()
+
+# Bounds how many moderation actions run concurrently across all chats
+# during raids (this limits concurrency, not the request rate)
+MAX_CONCURRENT_ACTIONS = 25
+_action_slots = asyncio.Semaphore(MAX_CONCURRENT_ACTIONS)
+
+
+async def _chat_worker(chat_id: int, jobs: asyncio.Queue):
+    while True:
+        args = await jobs.get()
+        try:
+            async with _action_slots:
+                await take_action(*args)
+        except Exception:
+            logger.exception("Moderation action failed in chat %s", chat_id)
+        
+        # No await between the check and the pop, so no job can slip in
+        if jobs.empty():
+            del chat_queues[chat_id]
+            return
+
+
+def enqueue_action(chat_id: int, *args):
+    """Queue take_action(*args) on the chat's worker, starting it if idle"""
+    jobs = chat_queues.get(chat_id)
+    if jobs is None:
+        jobs = chat_queues[chat_id] = asyncio.Queue()
+        worker = asyncio.create_task(_chat_worker(chat_id, jobs))
+        _chat_workers.add(worker)
+        worker.add_done_callback(_chat_workers.discard)
+    jobs.put_nowait(args)
 
 
 # === MESSAGE HANDLER ===
+_seen_groups: set[int] = set()
+
+
+def _log_group(update: Update):
+    # Log each group's chat ID once, for setup (see README)
+    chat = update.effective_chat
+    if chat.id not in _seen_groups and chat.type in ["group", "supergroup"]:
+        _seen_groups.add(chat.id)
+        logger.info("📍 Group detected: %s | ID: %s", chat.title, chat.id)
+
+
+async def handle_admin_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle messages from admins: +rep only, never moderated"""
+    
+    if not update.message or not update.message.text:
+        return
+    
+    _log_group(update)
+    await handle_plus_rep(update, context)
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle incoming messages and check for violations"""
     
     if not update.message or not update.message.text:
         return
     
-    # Log chat ID for setup (remove after getting ID)
-    chat = update.effective_chat
-    if chat.type in ["group", "supergroup"]:
-        print(f"📍 Group detected: {chat.title} | ID: {chat.id}")
+    _log_group(update)
     
-    user_id = update.effective_user.id
-    username = update.effective_user.username or str(user_id)
+    chat = update.effective_chat
+    user = update.effective_user
+    user_id = user.id
+    username = display_name(user)
     text = update.message.text
     
     # Check for +rep first
     if await handle_plus_rep(update, context):
         return  # Was a +rep message, don't process further
     
-    # Test mode: /testme command allows admins to test on themselves
-    if text.startswith("/testme "):
-        test_text = text[8:]  # Remove "/testme "
-        result = analyzer.analyze(test_text, user_id, username)
-        
-        response = f"🧪 TEST ANALYSIS\n\n"
-        response += f"📝 Text: \"{test_text[:100]}\"\n\n"
-        response += f"🚨 Violation: {'YES' if result.is_violation else 'NO'}\n"
-        if result.is_violation:
-            response += f"📋 Type: {result.violation_type}\n"
-            response += f"📊 Confidence: {result.confidence:.0%}\n"
-            response += f"💬 Reason: {result.reason}\n\n"
-            response += f"Actions:\n"
-            response += f"  Delete: {'✅' if result.should_delete else '❌'}\n"
-            response += f"  Warn: {'✅' if result.should_warn else '❌'}\n"
-            response += f"  Mute: {'✅' if result.should_mute else '❌'}\n"
-            response += f"  Ban: {'✅' if result.should_ban else '❌'}"
-        else:
-            response += f"✅ Message is clean!"
-        
-        await update.message.reply_text(response)
-        return
-    
-    # Skip messages from admins (normal mode)
-    if update.effective_user.id in ADMIN_IDS:
-        return
-    
-    # Analyze message
+    # Analyze message (admin messages never get here, see handle_admin_message)
     result = analyzer.analyze(text, user_id, username)
     
     # Debug logging
-    print(f"📝 Message from @{username}: \"{text[:50]}\"")
-    print(f"   Violation: {result.is_violation}, Confidence: {result.confidence}, Type: {result.violation_type}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📝 Message from @%s: \"%s\"", username, text[:50])
+        logger.debug(
+            "   Violation: %s, Confidence: %s, Type: %s",
+            result.is_violation, result.confidence, result.violation_type
+        )
     
     # Check if user is defending Relay (give +rep)
-    if not result.is_violation and "relay" in text.lower():
-        positive_words = ["love", "best", "great", "awesome", "amazing", "perfect", "excellent",
-                         "люблю", "лучший", "круто", "супер", "отлично"]
-        if any(word in text.lower() for word in positive_words):
+    if not result.is_violation:
+        text_lower = text.lower()
+        if "relay" in text_lower and _PRAISE_WORDS.found(text_lower):
             new_rep = rep_positive(user_id, username)
-            print(f"   ⭐ +rep for positive feedback! Total: {new_rep}")
+            logger.info("   ⭐ +rep for positive feedback! Total: %s", new_rep)
     
     # Only act on high-confidence violations
     if result.is_violation and result.confidence >= 0.6:
-        print(f"   🚨 Taking action!")
-        await take_action(update, context, result, user_id, username, text)
+        logger.info("   🚨 Taking action!")
+        enqueue_action(chat.id, update, context, result, user_id, username, text)
 
 
 # === COMMANDS ===
@@ -401,6 +609,7 @@ async def cmd_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     reported_message = update.message.reply_to_message
     reported_user = reported_message.from_user
+    reported_name = display_name(reported_user)
     reporter = update.effective_user
     
     # Get reason from command args
@@ -423,29 +632,30 @@ async def cmd_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Create report
     report = Report(
         reporter_id=reporter.id,
-        reporter_username=reporter.username or str(reporter.id),
+        reporter_username=display_name(reporter),
         reported_user_id=reported_user.id,
-        reported_username=reported_user.username or str(reported_user.id),
-        reported_message=reported_text[:500],
+        reported_username=reported_name,
+        reported_message=reported_text,  # Truncated by Report
         reason=reason,
         status="pending",
-        timestamp=datetime.now().isoformat()
+        timestamp=datetime.now(timezone.utc).isoformat()
     )
     
     report_id = record_report(report)
     
     # If high confidence violation, take action immediately
     if result.is_violation and result.confidence >= 0.7:
-        await take_action(
+        enqueue_action(
+            update.effective_chat.id,
             update, context, result,
             reported_user.id,
-            reported_user.username or str(reported_user.id),
+            reported_name,
             reported_text
         )
         update_report_status(report_id, "actioned", f"Auto-actioned: {result.reason}")
         
         await update.message.reply_text(
-            MESSAGES["report_actioned"].format(
+            _format_report_actioned(
                 report_id=report_id,
                 action=result.violation_type
             ),
@@ -454,57 +664,76 @@ async def cmd_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         # Queue for admin review
         await update.message.reply_text(
-            MESSAGES["report_received"].format(report_id=report_id),
+            _format_report_received(report_id=report_id),
             parse_mode=ParseMode.MARKDOWN
         )
         
-        # Notify admins
-        for admin_id in ADMIN_IDS:
-            try:
-                await context.bot.send_message(
+        # Notify the admin chat, or every admin concurrently (failures for
+        # one admin are ignored)
+        admin_text = (
+            f"📋 *New Report #{report_id}*\n\n"
+            f"Reporter: @{reporter.username}\n"
+            f"Reported: @{reported_user.username}\n"
+            f"Reason: {reason}\n\n"
+            f"Message: _{reported_text[:200]}_\n\n"
+            f"Analysis: {result.reason}\n"
+            f"Confidence: {result.confidence:.0%}"
+        )
+        recipients = (ADMIN_CHAT_ID,) if ADMIN_CHAT_ID is not None else ADMIN_IDS
+        await asyncio.gather(
+            *(
+                context.bot.send_message(
                     chat_id=admin_id,
-                    text=f"📋 *New Report #{report_id}*\n\n"
-                         f"Reporter: @{reporter.username}\n"
-                         f"Reported: @{reported_user.username}\n"
-                         f"Reason: {reason}\n\n"
-                         f"Message: _{reported_text[:200]}_\n\n"
-                         f"Analysis: {result.reason}\n"
-                         f"Confidence: {result.confidence:.0%}",
+                    text=admin_text,
                     parse_mode=ParseMode.MARKDOWN
                 )
-            except Exception:
-                pass
+                for admin_id in recipients
+            ),
+            return_exceptions=True
+        )
+
+
+MYSTATUS_TEMPLATE = (
+    "📊 YOUR STATUS\n"
+    "━━━━━━━━━━━━━━━━━━━━\n\n"
+    "👤 @{username}\n"
+    "🏆 Rank: {rank}\n"
+    "⭐ Reputation: {total_rep} pts\n"
+    "🎖️ Badges: {badges}\n\n"
+    "{record}"
+    "\n━━━━━━━━━━━━━━━━━━━━\n"
+    "💡 Earn rep by helping others and defending Relay!"
+)
+MYSTATUS_RECORD = "⚠️ Warnings: {warnings}\n🔇 Mutes: {mutes}\n🚫 Bans: {bans}\n"
+MYSTATUS_CLEAN_RECORD = "✅ Clean record!\n"
 
 
 async def cmd_mystatus(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user's reputation and violation history"""
-    user_id = update.effective_user.id
-    username = update.effective_user.username or str(user_id)
+    user = update.effective_user
+    user_id = user.id
+    username = display_name(user)
     
     # Get reputation
     rep_info = get_rep(user_id)
     violations = get_user_violations(user_id)
     
-    badges_str = " ".join(rep_info["badges"]) if rep_info["badges"] else "None yet"
-    
-    text = f"📊 YOUR STATUS\n"
-    text += f"━━━━━━━━━━━━━━━━━━━━\n\n"
-    text += f"👤 @{username}\n"
-    text += f"🏆 Rank: {rep_info['rank']}\n"
-    text += f"⭐ Reputation: {rep_info['total_rep']} pts\n"
-    text += f"🎖️ Badges: {badges_str}\n\n"
-    
     if violations.get("violations"):
-        text += f"⚠️ Warnings: {violations.get('warnings', 0)}\n"
-        text += f"🔇 Mutes: {violations.get('mutes', 0)}\n"
-        text += f"🚫 Bans: {violations.get('bans', 0)}\n"
+        record = MYSTATUS_RECORD.format(
+            warnings=violations.get("warnings", 0),
+            mutes=violations.get("mutes", 0),
+            bans=violations.get("bans", 0)
+        )
     else:
-        text += f"✅ Clean record!\n"
-    
-    text += f"\n━━━━━━━━━━━━━━━━━━━━\n"
-    text += f"💡 Earn rep by helping others and defending Relay!"
-    
-    await update.message.reply_text(text)
+        record = MYSTATUS_CLEAN_RECORD
+    
+    await update.message.reply_text(MYSTATUS_TEMPLATE.format(
+        username=username,
+        rank=rep_info["rank"],
+        total_rep=rep_info["total_rep"],
+        badges=" ".join(rep_info["badges"]) if rep_info["badges"] else "None yet",
+        record=record
+    ))
 
 
 async def cmd_rep(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -519,15 +748,24 @@ async def cmd_rep(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     badges_str = " ".join(rep_info["badges"]) if rep_info["badges"] else "None"
     
-    text = f"📊 @{target.username or target.id}\n"
+    text = f"📊 @{display_name(target)}\n"
     text += f"🏆 {rep_info['rank']} • ⭐ {rep_info['total_rep']} pts\n"
     text += f"🎖️ {badges_str}"
     
     await update.message.reply_text(text)
 
 
+LEADERBOARD_CACHE_SECONDS = 60  # How long a rendered /top reply is reused
+_leaderboard_cache = {"text": None, "expires": 0.0}
+
+
 async def cmd_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show reputation leaderboard"""
+    now = time.monotonic()
+    if now < _leaderboard_cache["expires"]:
+        await update.message.reply_text(_leaderboard_cache["text"])
+        return
+    
     leaders = get_leaderboard(10)
     
     if not leaders:
@@ -547,18 +785,37 @@ async def cmd_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text += "\n━━━━━━━━━━━━━━━━━━━━\n"
     text += "💡 /mystatus to see your rank"
     
+    _leaderboard_cache["text"] = text
+    _leaderboard_cache["expires"] = now + LEADERBOARD_CACHE_SECONDS
+    
     await update.message.reply_text(text)
 
 
 # === ADMIN COMMANDS ===
+ADMIN_REQUIRED = MESSAGES["admin_required"]
+
+
+def admin_only(handler):
+    """Reply with ADMIN_REQUIRED instead of running handler for non-admins"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text(ADMIN_REQUIRED)
+            return
+        return await handler(update, context)
+    return wrapper
+
+
+@admin_only
 async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show moderation statistics (admin only)"""
-    if update.effective_user.id not in ADMIN_IDS:
-        await update.message.reply_text(MESSAGES["admin_required"])
-        return
-    
     stats = get_stats()
     
+    offenders = "".join(
+        f"{i}. @{escape_markdown(username)} — {count}\n"
+        for i, (username, count) in enumerate(stats["top_offenders"], 1)
+    )
+    
     await update.message.reply_text(
         f"📊 *Moderation Statistics*\n\n"
         f"Users with violations: {stats['total_users_with_violations']}\n"
@@ -567,17 +824,15 @@ async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"├ Mutes: {stats['total_mutes']}\n"
         f"└ Bans: {stats['total_bans']}\n\n"
         f"Reports: {stats['total_reports']}\n"
-        f"└ Pending: {stats['pending_reports']}",
+        f"└ Pending: {stats['pending_reports']}"
+        + (f"\n\nTop offenders:\n{offenders}" if offenders else ""),
         parse_mode=ParseMode.MARKDOWN
     )
 
 
+@admin_only
 async def cmd_pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show pending reports (admin only)"""
-    if update.effective_user.id not in ADMIN_IDS:
-        await update.message.reply_text(MESSAGES["admin_required"])
-        return
-    
     reports = get_pending_reports()
     
     if not reports:
@@ -609,6 +864,9 @@ async def cmd_pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+REVIEW_CALLBACK_RE = re.compile(r"review_(\d+)_(warn|mute|ban|dismiss)")
+
+
 async def handle_review_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle review button clicks"""
     query = update.callback_query
@@ -619,12 +877,12 @@ async def handle_review_callback(update: Update, context: ContextTypes.DEFAULT_T
         return
     
     # Parse callback data: review_1_warn
-    parts = query.data.split("_")
-    if len(parts) != 3:
+    match = REVIEW_CALLBACK_RE.fullmatch(query.data)
+    if not match:
         return
     
-    _, report_id, action = parts
-    report_id = int(report_id)
+    report_id = int(match[1])
+    action = match[2]
     
     if action == "dismiss":
         update_report_status(report_id, "dismissed", "Admin dismissed")
@@ -640,12 +898,9 @@ async def handle_review_callback(update: Update, context: ContextTypes.DEFAULT_T
         )
 
 
+@admin_only
 async def cmd_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Review a report (admin only)"""
-    if update.effective_user.id not in ADMIN_IDS:
-        await update.message.reply_text(MESSAGES["admin_required"])
-        return
-    
     if len(context.args) < 2:
         await update.message.reply_text(
             "Usage: /review <report_id> <action>\n"
@@ -668,146 +923,163 @@ async def cmd_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"✅ Report #{report_id} actioned: {action}")
 
 
-async def cmd_warn(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Manually warn a user (admin only)"""
-    if update.effective_user.id not in ADMIN_IDS:
-        await update.message.reply_text(MESSAGES["admin_required"])
+TESTME_CLEAN = "🧪 TEST ANALYSIS\n\n📝 Text: \"{text}\"\n\n🚨 Violation: NO\n✅ Message is clean!"
+TESTME_VIOLATION = """🧪 TEST ANALYSIS
+
+📝 Text: "{text}"
+
+🚨 Violation: YES
+📋 Type: {result.violation_type}
+📊 Confidence: {result.confidence:.0%}
+💬 Reason: {result.reason}
+
+Actions:
+  Delete: {delete}
+  Warn: {warn}
+  Mute: {mute}
+  Ban: {ban}"""
+
+
+def _mark(flag: bool) -> str:
+    return "✅" if flag else "❌"
+
+
+@admin_only
+async def cmd_testme(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show how the analyzer would treat a text (admin only)"""
+    test_text = update.message.text.partition(" ")[2]  # Raw text after /testme
+    if not test_text:
+        await update.message.reply_text("Usage: /testme <text>")
         return
     
-    if not update.message.reply_to_message:
-        await update.message.reply_text("Reply to a message to warn the user")
-        return
+    user = update.effective_user
+    result = analyzer.analyze(test_text, user.id, display_name(user))
     
-    target = update.message.reply_to_message.from_user
-    reason = " ".join(context.args) if context.args else "Admin warning"
+    if len(test_text) > 100:
+        test_text = test_text[:100]
     
-    await warn_user(update, context, target.id, target.username or str(target.id), reason)
+    if not result.is_violation:
+        await update.message.reply_text(TESTME_CLEAN.format(text=test_text))
+        return
     
-    violation = Violation(
-        user_id=target.id,
-        username=target.username or str(target.id),
-        violation_type="admin_warn",
-        reason=reason,
-        message_text="",
-        action_taken="warn",
-        timestamp=datetime.now().isoformat(),
-        confidence=1.0
-    )
-    record_violation(violation)
+    await update.message.reply_text(TESTME_VIOLATION.format(
+        text=test_text,
+        result=result,
+        delete=_mark(result.should_delete),
+        warn=_mark(result.should_warn),
+        mute=_mark(result.should_mute),
+        ban=_mark(result.should_ban)
+    ))
 
 
-async def cmd_mute(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Manually mute a user (admin only)"""
-    if update.effective_user.id not in ADMIN_IDS:
-        await update.message.reply_text(MESSAGES["admin_required"])
-        return
-    
+# Manual admin actions: action -> (helper, default reason)
+ADMIN_ACTIONS = {
+    "warn": (warn_user, "Admin warning"),
+    "mute": (mute_user, "Admin mute"),
+    "ban": (ban_user, "Admin ban"),
+}
+
+
+async def _cmd_admin_action(action: str, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Apply a manual warn/mute/ban to the replied-to user"""
     if not update.message.reply_to_message:
-        await update.message.reply_text("Reply to a message to mute the user")
+        await update.message.reply_text(f"Reply to a message to {action} the user")
         return
     
+    apply_action, default_reason = ADMIN_ACTIONS[action]
     target = update.message.reply_to_message.from_user
-    reason = " ".join(context.args) if context.args else "Admin mute"
+    target_name = display_name(target)
+    reason = " ".join(context.args) if context.args else default_reason
+    now = datetime.now(timezone.utc)
     
-    await mute_user(update, context, target.id, target.username or str(target.id), reason)
+    # Only mute and ban have an until_date to compute from now
+    kwargs = {} if action == "warn" else {"now": now}
+    await apply_action(update, context, target.id, target_name, reason, **kwargs)
     
     violation = Violation(
         user_id=target.id,
-        username=target.username or str(target.id),
-        violation_type="admin_mute",
+        username=target_name,
+        violation_type=f"admin_{action}",
         reason=reason,
         message_text="",
-        action_taken="mute",
-        timestamp=datetime.now().isoformat(),
+        action_taken=action,
+        timestamp=now.isoformat(),
         confidence=1.0
     )
-    record_violation(violation)
+    await save_violation(violation)
+
+
+@admin_only
+async def cmd_warn(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manually warn a user (admin only)"""
+    await _cmd_admin_action("warn", update, context)
+
 
+@admin_only
+async def cmd_mute(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Manually mute a user (admin only)"""
+    await _cmd_admin_action("mute", update, context)
 
+
+@admin_only
 async def cmd_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manually ban a user (admin only)"""
-    if update.effective_user.id not in ADMIN_IDS:
-        await update.message.reply_text(MESSAGES["admin_required"])
-        return
-    
-    if not update.message.reply_to_message:
-        await update.message.reply_text("Reply to a message to ban the user")
-        return
-    
-    target = update.message.reply_to_message.from_user
-    reason = " ".join(context.args) if context.args else "Admin ban"
-    
-    await ban_user(update, context, target.id, target.username or str(target.id), reason)
-    
-    violation = Violation(
-        user_id=target.id,
-        username=target.username or str(target.id),
-        violation_type="admin_ban",
-        reason=reason,
-        message_text="",
-        action_taken="ban",
-        timestamp=datetime.now().isoformat(),
-        confidence=1.0
-    )
-    record_violation(violation)
+    await _cmd_admin_action("ban", update, context)
 
 
 # === WELCOME & CAPTCHA ===
+# "a" is the correct option itself; its index is precomputed below
 WELCOME_PUZZLES = [
     {"q": "🍎 + 🍎 = ?", "a": 2, "options": [1, 2, 3, 4]},
     {"q": "🐱 How many legs does a cat have?", "a": 4, "options": [2, 3, 4, 6]},
-    {"q": "🌈 Relay is a...", "a": 1, "options": ["📱 App", "🍕 Pizza", "🚗 Car"]},
-    {"q": "🖥️ macOS is an...", "a": 0, "options": ["OS", "Browser", "Game"]},
+    {"q": "🌈 Relay is a...", "a": "📱 App", "options": ["📱 App", "🍕 Pizza", "🚗 Car"]},
+    {"q": "🖥️ macOS is an...", "a": "OS", "options": ["OS", "Browser", "Game"]},
     {"q": "1️⃣ + 2️⃣ = ?", "a": 3, "options": [2, 3, 4, 5]},
-    {"q": "🍕 Pick the NOT food:", "a": 2, "options": ["🍔", "🍟", "💻", "🍩"]},
+    {"q": "🍕 Pick the NOT food:", "a": "💻", "options": ["🍔", "🍟", "💻", "🍩"]},
 ]
+for _puzzle in WELCOME_PUZZLES:
+    _puzzle["correct_idx"] = _puzzle["options"].index(_puzzle["a"])
+del _puzzle
 
 
-async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Welcome new members with a captcha puzzle"""
-    
-    for member in update.message.new_chat_members:
-        # Skip bots
-        if member.is_bot:
-            continue
-        
-        user_id = member.id
-        username = member.username or member.first_name or str(user_id)
-        chat_id = update.effective_chat.id
-        
-        # Pick random puzzle
-        puzzle = random.choice(WELCOME_PUZZLES)
-        correct_idx = puzzle["options"].index(puzzle["a"]) if isinstance(puzzle["a"], str) else puzzle["a"]
-        
-        # For numeric answers, find the index
-        if isinstance(puzzle["a"], int) and puzzle["a"] not in [0, 1, 2, 3]:
-            # It's an actual number answer, find it in options
-            correct_idx = puzzle["options"].index(puzzle["a"])
-        
-        # Create buttons
-        buttons = []
-        for i, opt in enumerate(puzzle["options"]):
-            btn_text = str(opt)
-            callback = f"captcha_{user_id}_{i}_{correct_idx}"
-            buttons.append(InlineKeyboardButton(btn_text, callback_data=callback))
-        
-        keyboard = InlineKeyboardMarkup([buttons])
-        
-        # Restrict user until they solve captcha
-        try:
-            await context.bot.restrict_chat_member(
-                chat_id=chat_id,
-                user_id=user_id,
-                permissions=ChatPermissions(
-                    can_send_messages=False,
-                    can_send_other_messages=False
-                )
+async def _restrict_new_member(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int):
+    """Restrict a new member until they solve the captcha"""
+    try:
+        await context.bot.restrict_chat_member(
+            chat_id=chat_id,
+            user_id=user_id,
+            permissions=ChatPermissions(
+                can_send_messages=False,
+                can_send_other_messages=False
             )
-        except Exception as e:
-            print(f"Could not restrict {user_id}: {e}")
-        
-        # Send welcome with puzzle
-        msg = await context.bot.send_message(
+        )
+    except Exception as e:
+        logger.warning("Could not restrict %s: %s", user_id, e)
+
+
+async def _greet_member(update: Update, context: ContextTypes.DEFAULT_TYPE, member):
+    """Restrict one new member and post their captcha puzzle"""
+    user_id = member.id
+    username = friendly_name(member)
+    chat_id = update.effective_chat.id
+    
+    # Pick random puzzle
+    puzzle = random.choice(WELCOME_PUZZLES)
+    correct_idx = puzzle["correct_idx"]
+    
+    # Create buttons
+    buttons = []
+    for i, opt in enumerate(puzzle["options"]):
+        btn_text = str(opt)
+        callback = f"captcha_{user_id}_{i}_{correct_idx}"
+        buttons.append(InlineKeyboardButton(btn_text, callback_data=callback))
+    
+    keyboard = InlineKeyboardMarkup([buttons])
+    
+    # Restrict and send the puzzle concurrently (independent API calls)
+    _, msg = await asyncio.gather(
+        _restrict_new_member(context, chat_id, user_id),
+        context.bot.send_message(
             chat_id=chat_id,
             text=f"👋 Hey *{username}*!\n\n"
                  f"Welcome to Relay Community!\n\n"
@@ -816,15 +1088,29 @@ async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=keyboard
         )
-        
-        # Store pending captcha
-        pending_captcha[user_id] = {
-            "correct": correct_idx,
-            "chat_id": chat_id,
-            "message_id": msg.message_id,
-            "timestamp": datetime.now().isoformat(),
-            "username": username
-        }
+    )
+    
+    # Store pending captcha
+    pending_captcha[user_id] = PendingCaptcha(
+        correct=correct_idx,
+        chat_id=chat_id,
+        message_id=msg.message_id,
+        username=username,
+        deadline=time.monotonic() + CAPTCHA_TIMEOUT_SECONDS
+    )
+
+
+async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Welcome new members with a captcha puzzle"""
+    # Bots are skipped; everyone else is greeted concurrently
+    await asyncio.gather(*(
+        _greet_member(update, context, member)
+        for member in update.message.new_chat_members
+        if not member.is_bot
+    ))
+
+
+CAPTCHA_CALLBACK_RE = re.compile(r"captcha_(\d+)_(\d+)_(\d+)")
 
 
 async def handle_captcha_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -832,15 +1118,12 @@ async def handle_captcha_callback(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     
     # Parse: captcha_{user_id}_{clicked}_{correct}
-    parts = query.data.split("_")
-    if len(parts) != 4:
+    match = CAPTCHA_CALLBACK_RE.fullmatch(query.data)
+    if not match:
         await query.answer("❌ Ошибка")
         return
     
-    _, target_user_id, clicked, correct = parts
-    target_user_id = int(target_user_id)
-    clicked = int(clicked)
-    correct = int(correct)
+    target_user_id, clicked, correct = map(int, match.groups())
     
     # Only the target user can answer
     if query.from_user.id != target_user_id:
@@ -848,7 +1131,8 @@ async def handle_captcha_callback(update: Update, context: ContextTypes.DEFAULT_
         return
     
     chat_id = query.message.chat_id
-    username = pending_captcha.get(target_user_id, {}).get("username", "friend")
+    pending = pending_captcha.get(target_user_id)
+    username = pending.username if pending is not None else "friend"
     
     if clicked == correct:
         # Correct! Unrestrict user
@@ -865,7 +1149,7 @@ async def handle_captcha_callback(update: Update, context: ContextTypes.DEFAULT_
                 )
             )
         except Exception as e:
-            print(f"Could not unrestrict {target_user_id}: {e}")
+            logger.warning("Could not unrestrict %s: %s", target_user_id, e)
         
         # Update message
         await query.edit_message_text(
@@ -878,23 +1162,62 @@ async def handle_captcha_callback(update: Update, context: ContextTypes.DEFAULT_
         )
         
         # Clean up
-        if target_user_id in pending_captcha:
-            del pending_captcha[target_user_id]
+        pending_captcha.pop(target_user_id, None)
     else:
         # Wrong answer
         await query.answer("❌ Wrong! Try again", show_alert=True)
 
 
+CAPTCHA_SWEEP_SECONDS = 30  # How often unsolved captchas are checked for timeout
+
+
+async def _expire_captchas(bot):
+    """Kick members who did not solve their captcha within CAPTCHA_TIMEOUT_SECONDS"""
+    while True:
+        await asyncio.sleep(CAPTCHA_SWEEP_SECONDS)
+        now = time.monotonic()
+        
+        # Entries are in join order, so deadlines only grow from here
+        for user_id, pending in pending_captcha.items():
+            if pending.deadline > now:
+                break
+            pending_captcha.pop(user_id, None)
+            
+            if not CAPTCHA_KICK_ON_FAIL:
+                continue
+            
+            # Ban + unban removes the member but lets them join again
+            try:
+                await bot.ban_chat_member(chat_id=pending.chat_id, user_id=user_id)
+            except Exception as e:
+                logger.warning("Could not kick %s after captcha timeout: %s", user_id, e)
+                continue
+            try:
+                await bot.unban_chat_member(
+                    chat_id=pending.chat_id,
+                    user_id=user_id,
+                    only_if_banned=True
+                )
+            except Exception as e:
+                logger.error("Kicked %s after captcha timeout, but unban failed (still banned): %s", user_id, e)
+            
+            try:
+                await bot.delete_message(chat_id=pending.chat_id, message_id=pending.message_id)
+            except Exception as e:
+                logger.warning("Could not delete captcha message for %s: %s", user_id, e)
+
+
 # === +REP SYSTEM ===
+PLUS_REP_RE = re.compile(r"\+ ?rep", re.IGNORECASE)
+
+
 async def handle_plus_rep(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """
     Handle +rep messages. Returns True if message was a +rep command.
     User replies to someone's message with "+rep" or "спасибо +rep" etc.
     """
-    text = update.message.text.lower().strip()
-    
-    # Check if message contains +rep
-    if "+rep" not in text and "+ rep" not in text:
+    # Check if message contains +rep ("+rep" or "+ rep", any case)
+    if not PLUS_REP_RE.search(update.message.text):
         return False
     
     # Must be a reply
@@ -918,12 +1241,10 @@ async def handle_plus_rep(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return True
     
     # Check cooldown
-    giver_cooldowns = rep_cooldowns.get(giver.id, {})
-    last_rep_time = giver_cooldowns.get(receiver.id)
+    last_rep_time = rep_cooldowns.get((giver.id, receiver.id))
     
-    if last_rep_time:
-        last_time = datetime.fromisoformat(last_rep_time)
-        elapsed = (datetime.now() - last_time).total_seconds()
+    if last_rep_time is not None:
+        elapsed = time.monotonic() - last_rep_time
         
         if elapsed < REP_COOLDOWN_SECONDS:
             remaining = int((REP_COOLDOWN_SECONDS - elapsed) / 60)
@@ -934,19 +1255,17 @@ async def handle_plus_rep(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return True
     
     # Give rep!
-    receiver_username = receiver.username or receiver.first_name or str(receiver.id)
+    receiver_username = friendly_name(receiver)
     new_rep = add_rep(
         receiver.id, 
         receiver_username, 
         REP_POINTS_MANUAL, 
-        f"+rep от @{giver.username or giver.id}",
+        f"+rep от @{display_name(giver)}",
         "manual_rep"
     )
     
     # Update cooldown
-    if giver.id not in rep_cooldowns:
-        rep_cooldowns[giver.id] = {}
-    rep_cooldowns[giver.id][receiver.id] = datetime.now().isoformat()
+    rep_cooldowns[(giver.id, receiver.id)] = time.monotonic()
     
     # Get receiver's rank
     rep_info = get_rep(receiver.id)
@@ -960,7 +1279,103 @@ async def handle_plus_rep(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return True
 
 
+# === PERSISTENCE ===
+FLUSH_INTERVAL_SECONDS = 5  # How often buffered violations/reports/rep hit disk
+
+
+async def _flush_periodically():
+    """Write buffered moderation data to disk every few seconds"""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+        # A failed write keeps its data queued, so just log and retry next time
+        for flush_async in (flush_violations_async, flush_reputation_async):
+            try:
+                await flush_async()
+            except Exception:
+                logger.exception("Periodic flush failed")
+
+
+async def post_init(app: Application):
+    app.bot_data["flusher"] = asyncio.create_task(_flush_periodically())
+    app.bot_data["captcha_sweeper"] = asyncio.create_task(_expire_captchas(app.bot))
+    
+    # Start health server for Render (and, in webhook mode, the webhook)
+    app.bot_data["health"] = await start_health_server(app)
+
+
+ACTION_DRAIN_SECONDS = 10  # How long shutdown waits for queued moderation actions
+
+
+async def post_stop(app: Application):
+    # The bot can still call the API here, so let queued moderation actions
+    # run; each chat worker exits once its queue is empty
+    if _chat_workers:
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*_chat_workers, return_exceptions=True),
+                ACTION_DRAIN_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Stopped with moderation actions still queued")
+
+
+async def post_shutdown(app: Application):
+    health = app.bot_data.pop("health", None)
+    if health is not None:
+        health.close()
+    
+    for task_name in ("flusher", "captcha_sweeper"):
+        task = app.bot_data.pop(task_name, None)
+        if task is not None:
+            task.cancel()
+    flush_violations()
+    flush_reputation()
+
+
+async def serve_webhook(app: Application):
+    """
+    Receive updates by webhook on our own server. This takes the
+    Application through the same steps as run_polling, which calls the
+    post_* hooks itself; here the webhook replaces the polling loop
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    await app.initialize()
+    await post_init(app)
+    try:
+        await app.bot.set_webhook(
+            url=f"{PUBLIC_URL.rstrip('/')}/{BOT_TOKEN}",
+            secret_token=WEBHOOK_SECRET,
+            drop_pending_updates=True
+        )
+        await app.start()
+        try:
+            await stop.wait()
+        finally:
+            await app.stop()
+            await post_stop(app)
+    finally:
+        await app.shutdown()
+        await post_shutdown(app)
+
+
 # === MAIN ===
+def setup_logging() -> logging.handlers.QueueListener:
+    """Send log records through a queue so handlers never block on stdout"""
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL.upper())
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # One line per API call
+    
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    listener.start()
+    return listener
+
+
 def main():
     if BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
         print("❌ Set RELAY_GUARD_BOT_TOKEN!")
@@ -968,51 +1383,73 @@ def main():
         return
     
     print("🚔 Relay Guard Bot starting...")
+    log_listener = setup_logging()
+    
+    # Faster event loop when available; PTB creates its loop from the policy
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
-    # Start health server for Render
-    start_health_server()
-    
-    app = Application.builder().token(BOT_TOKEN).build()
-    
-    # Commands
-    app.add_handler(CommandHandler("start", cmd_start))
-    app.add_handler(CommandHandler("rules", cmd_rules))
-    app.add_handler(CommandHandler("report", cmd_report))
-    app.add_handler(CommandHandler("mystatus", cmd_mystatus))
-    app.add_handler(CommandHandler("rep", cmd_rep))
-    app.add_handler(CommandHandler("leaderboard", cmd_leaderboard))
-    app.add_handler(CommandHandler("top", cmd_leaderboard))
-    
-    # Admin commands
-    app.add_handler(CommandHandler("stats", cmd_stats))
-    app.add_handler(CommandHandler("pending", cmd_pending))
-    app.add_handler(CommandHandler("review", cmd_review))
-    app.add_handler(CommandHandler("warn", cmd_warn))
-    app.add_handler(CommandHandler("mute", cmd_mute))
-    app.add_handler(CommandHandler("ban", cmd_ban))
-    
-    # Callback handlers
-    app.add_handler(CallbackQueryHandler(handle_review_callback, pattern="^review_"))
-    app.add_handler(CallbackQueryHandler(handle_captcha_callback, pattern="^captcha_"))
-    
-    # New member handler
-    app.add_handler(MessageHandler(
-        filters.StatusUpdate.NEW_CHAT_MEMBERS,
-        handle_new_member
-    ))
+    # Handlers don't overlap, so order only affects how many checks an
+    # update goes through: the busiest (plain group text) comes first
+    # Admins are split off by the filter, so their messages are never analyzed
+    admin_filter = filters.User(user_id=ADMIN_IDS)
+    text_filter = filters.TEXT & ~filters.COMMAND
     
-    # Message handler (for auto-moderation and +rep)
-    app.add_handler(MessageHandler(
-        filters.TEXT & ~filters.COMMAND,
-        handle_message
-    ))
+    # Only watch the configured group, if there is one
+    if ALLOWED_GROUP_ID:
+        text_filter &= filters.Chat(chat_id=int(ALLOWED_GROUP_ID))
+    
+    app.add_handlers([
+        # Message handlers (auto-moderation and +rep; admins only +rep)
+        MessageHandler(text_filter & ~admin_filter, handle_message),
+        MessageHandler(text_filter & admin_filter, handle_admin_message),
+        
+        # Callback handlers
+        CallbackQueryHandler(handle_captcha_callback, pattern="^captcha_"),
+        CallbackQueryHandler(handle_review_callback, pattern="^review_"),
+        
+        # New member handler
+        MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, handle_new_member),
+        
+        # Commands
+        CommandHandler("start", cmd_start),
+        CommandHandler("rules", cmd_rules),
+        CommandHandler("report", cmd_report),
+        CommandHandler("mystatus", cmd_mystatus),
+        CommandHandler("rep", cmd_rep),
+        CommandHandler("leaderboard", cmd_leaderboard),
+        CommandHandler("top", cmd_leaderboard),
+        
+        # Admin commands
+        CommandHandler("stats", cmd_stats),
+        CommandHandler("pending", cmd_pending),
+        CommandHandler("review", cmd_review),
+        CommandHandler("testme", cmd_testme),
+        CommandHandler("warn", cmd_warn),
+        CommandHandler("mute", cmd_mute),
+        CommandHandler("ban", cmd_ban),
+    ])
     
     print("🚔 Relay Guard Bot is now protecting the community!")
     print("   Commands: /start, /rules, /report, /mystatus, /rep, /top")
-    print("   Admin: /stats, /pending, /warn, /mute, /ban")
+    print("   Admin: /stats, /pending, /warn, /mute, /ban, /testme")
     print("   Features: +rep, welcome captcha")
     
-    app.run_polling(drop_pending_updates=True)
+    if PUBLIC_URL:
+        # Telegram pushes updates to us, no getUpdates round trips
+        asyncio.run(serve_webhook(app))
+    else:
+        app.run_polling(drop_pending_updates=True)
+    log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -2,15 +2,29 @@
 Reputation system for Relay community
 +rep for defenders, -rep for violators
 """
+import asyncio
 import json
-from datetime import datetime
+import sqlite3
+import threading
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 from dataclasses import dataclass, asdict
+from itertools import islice
+
+from sortedcontainers import SortedKeyList
+
+try:
+    import orjson
+except ImportError:  # optional, fall back to the stdlib json module
+    orjson = None
 
 from config import DATA_DIR
 
-REPUTATION_FILE = DATA_DIR / "reputation.json"
+REPUTATION_DB = DATA_DIR / "reputation.db"
+REPUTATION_FILE = DATA_DIR / "reputation.json"  # Legacy format, imported once into the db
 
 # Rep points
 REP_DEFEND_RELAY = 5       # Defended Relay from hater
@@ -23,6 +37,15 @@ REP_VIOLATION_MUTE = -15   # Got muted
 REP_VIOLATION_BAN = -50    # Got banned
 REP_SPAM = -20             # Spam
 
+# Ranks by total rep: below 0 is RANK_NAMES[0], from 100 up RANK_NAMES[-1]
+RANK_THRESHOLDS = (0, 10, 30, 50, 100)
+RANK_NAMES = ("⚠️ Suspicious", "Newcomer", "Member", "Regular", "Trusted", "Legend")
+
+HISTORY_LIMIT = 50  # Events kept per user
+
+# Event types counted over the kept history (for badges): event_type -> counter key
+COUNTED_EVENTS = {"defend": "defense_count", "helpful": "help_count"}
+
 
 @dataclass
 class RepEvent:
@@ -37,18 +60,172 @@ def _ensure_data_dir():
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 
+# Loaded once and kept in memory; add_rep only marks the user dirty and
+# flush() writes the dirty users to the db (the bot flushes periodically
+# and on shutdown)
+_reputation: Optional[dict] = None
+_dirty_users: set[str] = set()
+
+# (total_rep, user_id) for every user, highest rep first; kept in step with
+# add_rep so the leaderboard never needs a full sort
+_leaderboard: Optional[SortedKeyList] = None
+
+# Single connection, only used under _write_lock (writes may come from a
+# worker thread)
+_conn: Optional[sqlite3.Connection] = None
+_write_lock = threading.Lock()
+
+
+def _loads(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _dumps(data) -> str:
+    # History deques are written as plain lists
+    if orjson is not None:
+        return orjson.dumps(data, default=list).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, default=list)
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _ensure_data_dir()
+        _conn = sqlite3.connect(REPUTATION_DB, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "user_id TEXT PRIMARY KEY, username TEXT, total_rep INTEGER, "
+            "badges TEXT, history TEXT)"
+        )
+    return _conn
+
+
+def _count_event(user: dict, event_type: str, delta: int):
+    counter = COUNTED_EVENTS.get(event_type)
+    if counter is not None:
+        user[counter] = user.get(counter, 0) + delta
+
+
 def _load_reputation() -> dict:
-    _ensure_data_dir()
-    if REPUTATION_FILE.exists():
-        with open(REPUTATION_FILE, "r") as f:
-            return json.load(f)
-    return {"users": {}}
+    global _reputation
+    if _reputation is None:
+        with _write_lock:
+            rows = _connect().execute(
+                "SELECT user_id, username, total_rep, badges, history FROM users"
+            ).fetchall()
+        
+        users = {
+            user_id: {
+                "username": username,
+                "total_rep": total_rep,
+                "history": _loads(history),
+                "badges": _loads(badges)
+            }
+            for user_id, username, total_rep, badges, history in rows
+        }
+        
+        # Import the old JSON file until the db holds its users (an empty
+        # table also covers a crash before the first flush)
+        if not users and REPUTATION_FILE.exists():
+            with open(REPUTATION_FILE, "rb") as f:
+                users = _loads(f.read())["users"]
+            _dirty_users.update(users)
+        
+        # History is a bounded deque in memory; counters are rebuilt from it
+        for user in users.values():
+            user["history"] = deque(user.get("history", []), maxlen=HISTORY_LIMIT)
+            for counter in COUNTED_EVENTS.values():
+                user[counter] = 0
+            for event in user["history"]:
+                _count_event(user, event.get("event_type"), 1)
+        
+        _reputation = {"users": users}
+    return _reputation
+
+
+def _load_leaderboard() -> SortedKeyList:
+    global _leaderboard
+    if _leaderboard is None:
+        _leaderboard = SortedKeyList(
+            ((u.get("total_rep", 0), uid) for uid, u in _load_reputation()["users"].items()),
+            key=lambda entry: -entry[0]
+        )
+    return _leaderboard
+
 
+# Same scheme as violations: serialize on the caller's thread, write under a
+# lock, and never let an older snapshot of a user overwrite a newer one
+_snapshot_seq = 0
+_written_seq: dict[str, int] = {}
 
-def _save_reputation(data: dict):
-    _ensure_data_dir()
-    with open(REPUTATION_FILE, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+
+def _snapshot() -> Optional[tuple[int, list[tuple]]]:
+    """Serialize the dirty users and clear the dirty set"""
+    global _snapshot_seq
+    if not _dirty_users:
+        return None
+    
+    users = _reputation["users"]
+    rows = [
+        (
+            user_id,
+            users[user_id].get("username", "Unknown"),
+            users[user_id].get("total_rep", 0),
+            _dumps(users[user_id].get("badges", [])),
+            _dumps(users[user_id]["history"])
+        )
+        for user_id in _dirty_users
+    ]
+    _dirty_users.clear()
+    _snapshot_seq += 1
+    return _snapshot_seq, rows
+
+
+def _write_snapshot(snapshot: tuple[int, list[tuple]]):
+    seq, rows = snapshot
+    with _write_lock:
+        rows = [row for row in rows if seq > _written_seq.get(row[0], 0)]
+        conn = _connect()
+        with conn:  # One transaction per flush
+            conn.executemany(
+                "INSERT INTO users (user_id, username, total_rep, badges, history) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, "
+                "total_rep = excluded.total_rep, badges = excluded.badges, "
+                "history = excluded.history",
+                rows
+            )
+        for row in rows:
+            _written_seq[row[0]] = seq
+
+
+def _restore(snapshot: tuple[int, list[tuple]]):
+    """Mark the users of a snapshot that failed to write as dirty again"""
+    _dirty_users.update(row[0] for row in snapshot[1])
+
+
+def flush():
+    """Write pending reputation changes to disk"""
+    snapshot = _snapshot()
+    if snapshot is not None:
+        try:
+            _write_snapshot(snapshot)
+        except Exception:
+            _restore(snapshot)
+            raise
+
+
+async def flush_async():
+    """Like flush(), but the disk write runs in a worker thread"""
+    snapshot = _snapshot()
+    if snapshot is not None:
+        try:
+            await asyncio.to_thread(_write_snapshot, snapshot)
+        except Exception:
+            _restore(snapshot)
+            raise
 
 
 def add_rep(user_id: int, username: str, points: int, reason: str, event_type: str) -> int:
@@ -63,29 +240,41 @@ def add_rep(user_id: int, username: str, points: int, reason: str, event_type: s
         data["users"][user_id_str] = {
             "username": username,
             "total_rep": 0,
-            "history": [],
-            "badges": []
+            "history": deque(maxlen=HISTORY_LIMIT),
+            "badges": [],
+            "defense_count": 0,
+            "help_count": 0
         }
     
     user = data["users"][user_id_str]
     user["username"] = username
+    
+    leaderboard = _load_leaderboard()
+    leaderboard.discard((user["total_rep"], user_id_str))
     user["total_rep"] += points
+    leaderboard.add((user["total_rep"], user_id_str))
     
     event = RepEvent(
         event_type=event_type,
         points=points,
         reason=reason,
-        timestamp=datetime.now().isoformat()
+        timestamp=datetime.now(timezone.utc).isoformat()
     )
-    user["history"].append(asdict(event))
-    
-    # Keep only last 50 events
-    user["history"] = user["history"][-50:]
+    # The deque drops the oldest event once full; uncount it first
+    history = user["history"]
+    if len(history) == HISTORY_LIMIT:
+        _count_event(user, history[0].get("event_type"), -1)
+    history.append(asdict(event))
+    _count_event(user, event_type, 1)
     
-    # Check for badges
-    _check_badges(user)
+    # Check for badges; they are never taken away and only depend on the
+    # defend/helpful counters and on rep reaching 50 or 100, so skip events
+    # that cannot earn one
+    total = user["total_rep"]
+    if event_type in COUNTED_EVENTS or (points > 0 and total - points < 100 and total >= 50):
+        _check_badges(user)
     
-    _save_reputation(data)
+    _dirty_users.add(user_id_str)
     
     return user["total_rep"]
 
@@ -94,10 +283,7 @@ def _check_badges(user: dict):
     """Award badges based on rep and activity"""
     badges = user.get("badges", [])
     total = user["total_rep"]
-    history = user.get("history", [])
-    
-    # Count defense events
-    defense_count = sum(1 for e in history if e.get("event_type") == "defend")
+    defense_count = user.get("defense_count", 0)
     
     # Badge: Defender
     if defense_count >= 3 and "🛡️ Defender" not in badges:
@@ -116,7 +302,7 @@ def _check_badges(user: dict):
         badges.append("👑 Legend")
     
     # Badge: Helper
-    help_count = sum(1 for e in history if e.get("event_type") == "helpful")
+    help_count = user.get("help_count", 0)
     if help_count >= 5 and "💡 Helper" not in badges:
         badges.append("💡 Helper")
     
@@ -138,46 +324,27 @@ def get_rep(user_id: int) -> dict:
     user = data["users"][user_id_str]
     total = user.get("total_rep", 0)
     
-    # Determine rank
-    if total < 0:
-        rank = "⚠️ Suspicious"
-    elif total < 10:
-        rank = "Newcomer"
-    elif total < 30:
-        rank = "Member"
-    elif total < 50:
-        rank = "Regular"
-    elif total < 100:
-        rank = "Trusted"
-    else:
-        rank = "Legend"
-    
     return {
         "total_rep": total,
         "badges": user.get("badges", []),
-        "rank": rank,
+        "rank": RANK_NAMES[bisect_right(RANK_THRESHOLDS, total)],
         "history_count": len(user.get("history", []))
     }
 
 
 def get_leaderboard(limit: int = 10) -> list:
     """Get top users by reputation"""
-    data = _load_reputation()
+    users = _load_reputation()["users"]
     
-    users = [
+    return [
         {
             "user_id": uid,
-            "username": u.get("username", "Unknown"),
-            "total_rep": u.get("total_rep", 0),
-            "badges": u.get("badges", [])
+            "username": users[uid].get("username", "Unknown"),
+            "total_rep": total_rep,
+            "badges": users[uid].get("badges", [])
         }
-        for uid, u in data.get("users", {}).items()
+        for total_rep, uid in islice(_load_leaderboard(), limit)
     ]
-    
-    # Sort by rep descending
-    users.sort(key=lambda x: x["total_rep"], reverse=True)
-    
-    return users[:limit]
 
 
 # Convenience functions
@@ -1,13 +1,28 @@
 """
 Violation tracking for Relay Guard Bot
 """
+import asyncio
+import heapq
 import json
+import os
+import sys
+import threading
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, List
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 
-from config import DATA_DIR, VIOLATIONS_FILE, REPORTS_FILE, WARN_BEFORE_BAN
+try:
+    import orjson
+except ImportError:  # optional, fall back to the stdlib json module
+    orjson = None
+
+from config import DATA_DIR, VIOLATIONS_LOG, VIOLATIONS_FILE, REPORTS_FILE, WARN_BEFORE_BAN
+
+
+MAX_STORED_TEXT = 500  # Message text kept per violation/report
+TOP_OFFENDERS = 5  # Users listed by violation count in get_stats
 
 
 @dataclass
@@ -21,6 +36,14 @@ class Violation:
     action_taken: str
     timestamp: str
     confidence: float
+    
+    def __post_init__(self):
+        if len(self.message_text) > MAX_STORED_TEXT:
+            self.message_text = self.message_text[:MAX_STORED_TEXT]
+    
+    def to_dict(self) -> dict:
+        """Fields as a dict (all primitives, so no deep copy like asdict)"""
+        return dict(self.__dict__)
 
 
 @dataclass 
@@ -35,50 +58,72 @@ class Report:
     status: str  # pending, reviewed, actioned, dismissed
     timestamp: str
     admin_notes: str = ""
+    
+    def __post_init__(self):
+        if len(self.reported_message) > MAX_STORED_TEXT:
+            self.reported_message = self.reported_message[:MAX_STORED_TEXT]
+    
+    def to_dict(self) -> dict:
+        """Fields as a dict (all primitives, so no deep copy like asdict)"""
+        return dict(self.__dict__)
 
 
 def _ensure_data_dir():
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def _load_violations() -> dict:
-    _ensure_data_dir()
-    if VIOLATIONS_FILE.exists():
-        with open(VIOLATIONS_FILE, "r") as f:
-            return json.load(f)
-    return {"users": {}}
+def _loads(raw: bytes):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
 
 
-def _save_violations(data: dict):
-    _ensure_data_dir()
-    with open(VIOLATIONS_FILE, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def _read_json(path: Path):
+    with open(path, "rb") as f:
+        return _loads(f.read())
 
 
-def _load_reports() -> dict:
-    _ensure_data_dir()
-    if REPORTS_FILE.exists():
-        with open(REPORTS_FILE, "r") as f:
-            return json.load(f)
-    return {"reports": []}
+def _dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
 
 
-def _save_reports(data: dict):
-    _ensure_data_dir()
-    with open(REPORTS_FILE, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def _dumps_line(record: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record) + b"\n"
+    return json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
 
 
-def record_violation(violation: Violation) -> int:
-    """
-    Record a violation and return total violation count for user.
-    """
-    data = _load_violations()
-    user_id_str = str(violation.user_id)
+# Loaded once and kept in memory; writes only queue or mark changes and
+# flush() persists them (the bot flushes periodically and on shutdown).
+# Violations are an append-only log, reports a whole-file rewrite.
+_violations: Optional[dict] = None
+_reports: Optional[dict] = None
+_reports_dirty = False
+
+# Serialized violation lines waiting to be appended to VIOLATIONS_LOG
+# (deque: appended on the event loop, drained by whichever thread writes)
+_log_queue: deque[bytes] = deque()
+
+# Running totals over all violations, kept up to date by _apply_violation
+_totals = {"violations": 0, "warnings": 0, "mutes": 0, "bans": 0}
+
+# Report indexes, built by _load_reports: id -> report, and the pending
+# reports alone (in id order; a report never goes back to pending)
+_report_by_id: dict[int, dict] = {}
+_pending_reports: dict[int, dict] = {}
+
+
+def _apply_violation(data: dict, record: dict) -> dict:
+    """Add one violation record to the per-user index, return the user's entry"""
+    # Share one copy of the strings that repeat across a user's records
+    for key in ("username", "violation_type", "action_taken"):
+        record[key] = sys.intern(record[key])
+    
+    user_id_str = str(record["user_id"])
     
     if user_id_str not in data["users"]:
         data["users"][user_id_str] = {
-            "username": violation.username,
+            "username": record["username"],
             "violations": [],
             "warnings": 0,
             "mutes": 0,
@@ -86,18 +131,163 @@ def record_violation(violation: Violation) -> int:
         }
     
     user_data = data["users"][user_id_str]
-    user_data["violations"].append(asdict(violation))
-    user_data["username"] = violation.username  # Update username
+    user_data["violations"].append(record)
+    user_data["username"] = record["username"]  # Update username
     
     # Update counters
-    if violation.action_taken == "warn":
+    _totals["violations"] += 1
+    action = record["action_taken"]
+    if action == "warn":
         user_data["warnings"] += 1
-    elif violation.action_taken == "mute":
+        _totals["warnings"] += 1
+    elif action == "mute":
         user_data["mutes"] += 1
-    elif violation.action_taken == "ban":
+        _totals["mutes"] += 1
+    elif action == "ban":
         user_data["bans"] += 1
+        _totals["bans"] += 1
+    
+    return user_data
+
+
+def _load_violations() -> dict:
+    global _violations
+    if _violations is None:
+        _ensure_data_dir()
+        data = {"users": {}}
+        
+        if VIOLATIONS_LOG.exists():
+            with open(VIOLATIONS_LOG, "rb") as f:
+                for line in f:
+                    try:
+                        _apply_violation(data, _loads(line))
+                    except ValueError:
+                        continue  # Blank or torn line from an interrupted append
+        elif VIOLATIONS_FILE.exists():
+            # One-time import of the old monolithic file into the log
+            for user in _read_json(VIOLATIONS_FILE).get("users", {}).values():
+                for record in user.get("violations", []):
+                    _apply_violation(data, record)
+                    _log_queue.append(_dumps_line(record))
+        
+        _violations = data
+    return _violations
+
+
+def _load_reports() -> dict:
+    global _reports
+    if _reports is None:
+        _ensure_data_dir()
+        if REPORTS_FILE.exists():
+            _reports = _read_json(REPORTS_FILE)
+        else:
+            _reports = {"reports": []}
+        
+        for report in _reports["reports"]:
+            _report_by_id[report["id"]] = report
+            if report.get("status") == "pending":
+                _pending_reports[report["id"]] = report
+    return _reports
+
+
+def _mark_reports_dirty():
+    global _reports_dirty
+    _reports_dirty = True
+
+
+# Snapshots are serialized on the caller's thread, but may be written from
+# a worker thread; the sequence number keeps an older snapshot that finishes
+# late from overwriting a newer one, and the log queue is drained in order
+# under the lock
+_write_lock = threading.Lock()
+_snapshot_seq = 0
+_written_seq: dict[Path, int] = {}
+
+
+def _snapshot() -> list[tuple[Path, int, bytes]]:
+    """Serialize whatever is dirty and clear the dirty flags"""
+    global _reports_dirty, _snapshot_seq
+    snapshot = []
     
-    _save_violations(data)
+    if _reports_dirty:
+        _reports_dirty = False
+        _snapshot_seq += 1
+        snapshot.append((REPORTS_FILE, _snapshot_seq, _dumps(_reports)))
+    
+    return snapshot
+
+
+def _write_snapshot(snapshot: list[tuple[Path, int, bytes]]):
+    with _write_lock:
+        _ensure_data_dir()
+        
+        lines = []
+        while _log_queue:
+            lines.append(_log_queue.popleft())
+        if lines:
+            try:
+                with open(VIOLATIONS_LOG, "ab") as f:
+                    start = f.tell()
+                    try:
+                        f.write(b"".join(lines))
+                        f.flush()
+                    except OSError:
+                        f.truncate(start)  # Undo a partial append
+                        raise
+            except OSError:
+                _log_queue.extendleft(reversed(lines))  # Retry on the next flush
+                raise
+        
+        for path, seq, payload in snapshot:
+            if seq > _written_seq.get(path, 0):
+                # Write to a temp file and swap it in, so a crash never leaves half a file
+                tmp_path = path.with_suffix(".tmp")
+                with open(tmp_path, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+                _written_seq[path] = seq
+
+
+def _restore(snapshot: list[tuple[Path, int, bytes]]):
+    """Mark a snapshot that failed to write as dirty again"""
+    global _reports_dirty
+    if any(path == REPORTS_FILE for path, _, _ in snapshot):
+        _reports_dirty = True
+
+
+def flush():
+    """Write any pending violation/report changes to disk"""
+    snapshot = _snapshot()
+    try:
+        _write_snapshot(snapshot)
+    except Exception:
+        _restore(snapshot)
+        raise
+
+
+async def flush_async():
+    """Like flush(), but the disk write runs in a worker thread"""
+    snapshot = _snapshot()
+    if snapshot or _log_queue:
+        try:
+            await asyncio.to_thread(_write_snapshot, snapshot)
+        except Exception:
+            _restore(snapshot)
+            raise
+
+
+def record_violation(violation: Violation, flush_bans: bool = True) -> int:
+    """
+    Record a violation and return total violation count for user.
+    Bans are written to disk right away unless flush_bans is False.
+    """
+    record = violation.to_dict()
+    user_data = _apply_violation(_load_violations(), record)
+    _log_queue.append(_dumps_line(record))
+    
+    # Bans are permanent actions, persist them right away
+    if flush_bans and violation.action_taken == "ban":
+        flush()
     
     return len(user_data["violations"])
 
@@ -147,32 +337,37 @@ def record_report(report: Report) -> int:
     data = _load_reports()
     
     report_id = len(data["reports"]) + 1
-    report_dict = asdict(report)
+    report_dict = report.to_dict()
     report_dict["id"] = report_id
     
     data["reports"].append(report_dict)
-    _save_reports(data)
+    _report_by_id[report_id] = report_dict
+    if report_dict["status"] == "pending":
+        _pending_reports[report_id] = report_dict
+    _mark_reports_dirty()
     
     return report_id
 
 
 def get_pending_reports() -> List[dict]:
     """Get all pending reports"""
-    data = _load_reports()
-    return [r for r in data["reports"] if r.get("status") == "pending"]
+    _load_reports()
+    return list(_pending_reports.values())
 
 
 def update_report_status(report_id: int, status: str, admin_notes: str = ""):
     """Update report status"""
-    data = _load_reports()
+    _load_reports()
     
-    for report in data["reports"]:
-        if report.get("id") == report_id:
-            report["status"] = status
-            report["admin_notes"] = admin_notes
-            break
+    report = _report_by_id.get(report_id)
+    if report is None:
+        return
     
-    _save_reports(data)
+    report["status"] = status
+    report["admin_notes"] = admin_notes
+    if status != "pending":
+        _pending_reports.pop(report_id, None)
+    _mark_reports_dirty()
 
 
 def get_stats() -> dict:
@@ -180,32 +375,19 @@ def get_stats() -> dict:
     violations_data = _load_violations()
     reports_data = _load_reports()
     
-    total_violations = sum(
-        len(u.get("violations", []))
-        for u in violations_data.get("users", {}).values()
-    )
-    
-    total_warnings = sum(
-        u.get("warnings", 0)
-        for u in violations_data.get("users", {}).values()
-    )
-    
-    total_mutes = sum(
-        u.get("mutes", 0)
-        for u in violations_data.get("users", {}).values()
-    )
-    
-    total_bans = sum(
-        u.get("bans", 0)
-        for u in violations_data.get("users", {}).values()
-    )
-    
     return {
-        "total_users_with_violations": len(violations_data.get("users", {})),
-        "total_violations": total_violations,
-        "total_warnings": total_warnings,
-        "total_mutes": total_mutes,
-        "total_bans": total_bans,
+        "total_users_with_violations": len(violations_data["users"]),
+        "total_violations": _totals["violations"],
+        "total_warnings": _totals["warnings"],
+        "total_mutes": _totals["mutes"],
+        "total_bans": _totals["bans"],
         "total_reports": len(reports_data.get("reports", [])),
-        "pending_reports": len([r for r in reports_data.get("reports", []) if r.get("status") == "pending"])
+        "pending_reports": len(_pending_reports),
+        "top_offenders": [
+            (user["username"], len(user["violations"]))
+            for user in heapq.nlargest(
+                TOP_OFFENDERS, violations_data["users"].values(),
+                key=lambda user: len(user["violations"])
+            )
+        ]
     }